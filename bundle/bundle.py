@@ -0,0 +1,543 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Gluu
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+BUNDLE_FORMAT = 1
+MANIFEST_NAME = "manifest.json"
+BLOB_DIR = "blobs"
+CHUNK_SIZE = 1024 * 1024
+
+# packages installed by `install_master.py` and `install_consumer.py`;
+# dependencies are resolved and downloaded by apt-get
+PACKAGE_CHOICES = {
+    "master": [
+        "rng-tools",
+        "docker-engine",
+        "gluu-master",
+        "gluu-flask",
+        "gluu-agent",
+        "gluu-cluster-webui",
+    ],
+    "consumer": [
+        "rng-tools",
+        "docker-engine",
+        "gluu-consumer",
+        "gluu-agent",
+    ],
+}
+
+# images pulled by `test/deployment/start.py`
+IMAGE_CHOICES = ["mongo", "gluuengine", "gluuwebui"]
+
+logger = logging.getLogger("bundle")
+logger.setLevel(logging.INFO)
+ch = logging.StreamHandler()
+fmt = logging.Formatter('[%(levelname)s] %(message)s')
+ch.setFormatter(fmt)
+logger.addHandler(ch)
+
+
+def safe_subprocess_exec(cmd):
+    """Runs shell command safely.
+
+    :param cmd: String of command or list of arguments.
+    """
+    cmdlist = cmd if isinstance(cmd, list) else cmd.strip().split()
+    ppn = subprocess.Popen(
+        cmdlist,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    out, err = ppn.communicate()
+    return out.strip(), err.strip(), ppn.returncode
+
+
+def sha256_file(path):
+    """Calculates SHA-256 digest of a file.
+
+    :param path: Path to the file.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def download_packages(packages, dest):
+    """Downloads packages and their dependencies as .deb files.
+
+    apt resolves dependencies as if nothing were installed, so the bundle
+    carries everything a bare node needs, and only one branch of each
+    ``a | b`` dependency or virtual package is picked.
+
+    :param packages: List of package names.
+    :param dest: Directory where .deb files will be saved.
+    """
+    partial = os.path.join(dest, "partial")
+    if not os.path.exists(partial):
+        os.makedirs(partial)
+
+    status = os.path.join(dest, "status")
+    open(status, "w").close()
+
+    logger.info("downloading packages including dependencies")
+    _, err, returncode = safe_subprocess_exec(
+        ["apt-get", "install", "--download-only", "-y", "-q",
+         "--no-install-recommends",
+         "-o", "Dir::State::status={}".format(status),
+         "-o", "Dir::Cache::archives={}".format(dest),
+         # don't overwrite package cache built from the real status file
+         "-o", "Dir::Cache::pkgcache=",
+         "-o", "Dir::Cache::srcpkgcache="] + packages,
+    )
+    if returncode != 0:
+        raise RuntimeError(
+            "unable to download packages; reason={}".format(err)
+        )
+    return sorted(glob.glob(os.path.join(dest, "*.deb")))
+
+
+def deb_fields(path):
+    """Gets package name and version of a .deb file.
+
+    :param path: Path to the .deb file.
+    """
+    out, err, returncode = safe_subprocess_exec(
+        ["dpkg-deb", "-W", "--showformat=${Package}|${Version}", path]
+    )
+    if returncode != 0:
+        raise RuntimeError(
+            "unable to read {}; reason={}".format(path, err)
+        )
+    name, version = out.split("|", 1)
+    return name, version
+
+
+def installed_package_version(name):
+    """Gets version of installed package or empty string if not installed.
+
+    :param name: Name of the package.
+    """
+    out, _, returncode = safe_subprocess_exec(
+        ["dpkg-query", "-W", "--showformat=${Status}|${Version}", name]
+    )
+    if returncode != 0 or "|" not in out:
+        return ""
+
+    status, version = out.split("|", 1)
+    if not status.endswith(" installed"):
+        return ""
+    return version
+
+
+def version_satisfied(installed, version):
+    """Checks whether installed package version is at least ``version``.
+
+    :param installed: Installed version; empty if not installed.
+    :param version: Required version.
+    """
+    if not installed:
+        return False
+    _, _, returncode = safe_subprocess_exec(
+        ["dpkg", "--compare-versions", installed, "ge", version]
+    )
+    return returncode == 0
+
+
+def package_stanza(path, filename):
+    """Builds ``Packages`` index entry of a .deb file.
+
+    Same as what ``dpkg-scanpackages`` produces, without requiring
+    dpkg-dev on the node.
+
+    :param path: Path to the .deb file.
+    :param filename: Path of the file relative to repository root.
+    """
+    out, err, returncode = safe_subprocess_exec(["dpkg-deb", "-f", path])
+    if returncode != 0:
+        raise RuntimeError(
+            "unable to read {}; reason={}".format(path, err)
+        )
+    return "{}\nFilename: {}\nSize: {}\nSHA256: {}\n".format(
+        out, filename, os.path.getsize(path), sha256_file(path),
+    )
+
+
+def install_packages(debs, packages, repodir):
+    """Installs packages through apt using bundled .deb files as the only
+    repository.
+
+    apt picks which bundled dependencies the node actually needs, so
+    alternatives already satisfied on the node are left alone.
+
+    :param debs: List of paths to .deb files inside ``repodir``.
+    :param packages: List of package names to install.
+    :param repodir: Directory of flat repository.
+    """
+    with open(os.path.join(repodir, "Packages"), "w") as fp:
+        for path in debs:
+            fp.write(package_stanza(path, "./" + os.path.basename(path)))
+            fp.write("\n")
+
+    listdir = os.path.join(repodir, "lists")
+    partsdir = os.path.join(repodir, "sources.list.d")
+    os.makedirs(os.path.join(listdir, "partial"))
+    os.makedirs(partsdir)
+    source_list = os.path.join(repodir, "sources.list")
+    with open(source_list, "w") as fp:
+        fp.write("deb [trusted=yes] file:{} ./\n".format(repodir))
+
+    # package lists and caches of the node are kept untouched
+    options = [
+        "-o", "Dir::Etc::SourceList={}".format(source_list),
+        "-o", "Dir::Etc::SourceParts={}".format(partsdir),
+        "-o", "Dir::State::Lists={}".format(listdir),
+        "-o", "Dir::Cache::pkgcache=",
+        "-o", "Dir::Cache::srcpkgcache=",
+    ]
+
+    def apt_get(args):
+        _, err, returncode = safe_subprocess_exec(
+            ["env", "DEBIAN_FRONTEND=noninteractive", "apt-get", "-q"] +
+            options + args
+        )
+        if returncode != 0:
+            raise RuntimeError(
+                "unable to install packages; reason={}".format(err)
+            )
+
+    apt_get(["update"])
+    apt_get(["install", "-y", "--no-install-recommends"] + packages)
+
+
+def image_id(name):
+    """Gets ID of a local image or empty string if image is not found.
+
+    :param name: Name of the image.
+    """
+    try:
+        out, _, returncode = safe_subprocess_exec(
+            "docker inspect --type=image -f {{{{.Id}}}} {}".format(name)
+        )
+    except OSError:
+        # docker is not installed (yet)
+        return ""
+    if returncode != 0:
+        return ""
+    return out
+
+
+def save_image(name, dest):
+    """Saves image into a tarball.
+
+    :param name: Name of the image.
+    :param dest: Path to the tarball.
+    """
+    _, err, returncode = safe_subprocess_exec(
+        "docker save -o {} {}".format(dest, name)
+    )
+    if returncode != 0:
+        raise RuntimeError(
+            "unable to save image {}; reason={}".format(name, err)
+        )
+
+
+def add_blob(archive, path):
+    """Adds a file into archive using its digest as name.
+
+    Returns the digest and size of the file.
+
+    :param archive: Instance of ``tarfile.TarFile``.
+    :param path: Path to the file.
+    """
+    digest = sha256_file(path)
+    archive.add(path, arcname="{}/{}".format(BLOB_DIR, digest))
+    return digest, os.path.getsize(path)
+
+
+def build_bundle(version, role, images, output_dir):
+    """Builds a bundle containing .deb packages and image tarballs.
+
+    The bundle is named after its version and the digest of its artifacts,
+    so identical contents always produce identical names.
+
+    :param version: Version of the bundle.
+    :param role: Node role used to pick packages (``master`` or ``consumer``).
+    :param images: List of image names.
+    :param output_dir: Directory where bundle will be saved.
+    """
+    workdir = tempfile.mkdtemp(prefix="gluu-bundle-")
+    artifacts = []
+
+    try:
+        tmp_archive = os.path.join(workdir, "bundle.tar")
+        with tarfile.open(tmp_archive, "w") as archive:
+            packages = PACKAGE_CHOICES[role]
+            logger.info("downloading packages {}".format(", ".join(packages)))
+            debdir = os.path.join(workdir, "debs")
+
+            for path in download_packages(packages, debdir):
+                name, pkg_version = deb_fields(path)
+                digest, size = add_blob(archive, path)
+                artifacts.append({
+                    "kind": "deb",
+                    "name": name,
+                    "version": pkg_version,
+                    "digest": digest,
+                    "size": size,
+                })
+                logger.info("added package {} {}".format(name, pkg_version))
+                os.unlink(path)
+
+            for name in images:
+                iid = image_id(name)
+                if not iid:
+                    raise RuntimeError("image {} is not found; "
+                                       "please pull it first".format(name))
+
+                path = os.path.join(workdir, "image.tar")
+                logger.info("saving image {}".format(name))
+                save_image(name, path)
+                digest, size = add_blob(archive, path)
+                artifacts.append({
+                    "kind": "image",
+                    "name": name,
+                    "version": iid,
+                    "digest": digest,
+                    "size": size,
+                })
+                logger.info("added image {} {}".format(name, iid))
+                os.unlink(path)
+
+            manifest = {
+                "format": BUNDLE_FORMAT,
+                "version": version,
+                "role": role,
+                "packages": packages,
+                "created_at": int(time.time()),
+                "artifacts": artifacts,
+            }
+            manifest_path = os.path.join(workdir, MANIFEST_NAME)
+            with open(manifest_path, "w") as fp:
+                json.dump(manifest, fp, indent=2, sort_keys=True)
+            archive.add(manifest_path, arcname=MANIFEST_NAME)
+
+        # content address is derived from artifacts only, so rebuilding
+        # the same set of artifacts yields the same name
+        content_digest = hashlib.sha256(
+            json.dumps(sorted(item["digest"] for item in artifacts))
+        ).hexdigest()
+        bundle_path = os.path.join(
+            output_dir,
+            "gluu-bundle-{}-{}-{}.tar".format(
+                role, version, content_digest[:12],
+            ),
+        )
+        shutil.move(tmp_archive, bundle_path)
+        return bundle_path
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def read_manifest(archive):
+    """Reads manifest from bundle.
+
+    :param archive: Instance of ``tarfile.TarFile``.
+    """
+    fp = archive.extractfile(MANIFEST_NAME)
+    manifest = json.loads(fp.read())
+
+    if manifest.get("format") != BUNDLE_FORMAT:
+        raise RuntimeError("unsupported bundle format {}".format(
+            manifest.get("format"),
+        ))
+    return manifest
+
+
+def artifact_loaded(artifact):
+    """Checks whether an artifact is already installed or loaded.
+
+    Packages installed with the same or newer version are considered
+    loaded, so the bundle never downgrades them.
+
+    :param artifact: Artifact entry taken from manifest.
+    """
+    if artifact["kind"] == "deb":
+        return version_satisfied(
+            installed_package_version(artifact["name"]), artifact["version"],
+        )
+    return image_id(artifact["name"]) == artifact["version"]
+
+
+def extract_blob(archive, artifact, dest):
+    """Extracts a blob and verifies its checksum.
+
+    :param archive: Instance of ``tarfile.TarFile``.
+    :param artifact: Artifact entry taken from manifest.
+    :param dest: Path to extracted file.
+    """
+    src = archive.extractfile("{}/{}".format(BLOB_DIR, artifact["digest"]))
+    digest = hashlib.sha256()
+
+    with open(dest, "wb") as fp:
+        for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+            fp.write(chunk)
+
+    if digest.hexdigest() != artifact["digest"]:
+        raise RuntimeError("checksum mismatch for {} {}".format(
+            artifact["kind"], artifact["name"],
+        ))
+
+
+def load_bundle(path):
+    """Installs packages and loads images from bundle.
+
+    Artifacts already present on the node are skipped. Packages are
+    installed by apt from a repository made of the bundled .deb files.
+    Images are checked only after packages are installed, as docker itself
+    may come from the bundle.
+
+    :param path: Path to the bundle.
+    """
+    workdir = tempfile.mkdtemp(prefix="gluu-bundle-")
+    repodir = os.path.join(workdir, "repo")
+    os.makedirs(repodir)
+
+    def extract(archive, artifact, dirname):
+        if artifact_loaded(artifact):
+            logger.info("{} {} {} already loaded; skipping ...".format(
+                artifact["kind"], artifact["name"], artifact["version"],
+            ))
+            return ""
+
+        dest = os.path.join(
+            dirname, "{}.{}".format(artifact["digest"], artifact["kind"]),
+        )
+        extract_blob(archive, artifact, dest)
+        return dest
+
+    try:
+        with tarfile.open(path, "r") as archive:
+            manifest = read_manifest(archive)
+            logger.info("loading {} bundle version {}".format(
+                manifest["role"], manifest["version"],
+            ))
+
+            debs = []
+            for artifact in manifest["artifacts"]:
+                if artifact["kind"] == "deb":
+                    dest = extract(archive, artifact, repodir)
+                    if dest:
+                        debs.append(dest)
+
+            if debs:
+                packages = manifest.get("packages",
+                                        PACKAGE_CHOICES[manifest["role"]])
+                logger.info("installing {} from {} bundled package(s)".format(
+                    ", ".join(packages), len(debs),
+                ))
+                install_packages(debs, packages, repodir)
+
+            failed = []
+            for artifact in manifest["artifacts"]:
+                if artifact["kind"] != "image":
+                    continue
+
+                dest = extract(archive, artifact, workdir)
+                if not dest:
+                    continue
+
+                logger.info("loading image {}".format(artifact["name"]))
+                _, err, returncode = safe_subprocess_exec(
+                    "docker load -i {}".format(dest)
+                )
+                os.unlink(dest)
+                if returncode != 0:
+                    logger.warn("error while loading image {}; "
+                                "reason={}".format(artifact["name"], err))
+                    failed.append(artifact["name"])
+
+            if failed:
+                raise RuntimeError("unable to load image(s) {}".format(
+                    ", ".join(failed),
+                ))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build or load offline package and image bundle",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+
+    build_parser = subparsers.add_parser("build", help="build a bundle")
+    build_parser.add_argument("role", choices=sorted(PACKAGE_CHOICES))
+    build_parser.add_argument("--version", default=time.strftime("%Y%m%d"))
+    build_parser.add_argument("--image", action="append", dest="images",
+                              help="image to include (may be repeated); "
+                                   "defaults to {}".format(
+                                       ", ".join(IMAGE_CHOICES)))
+    build_parser.add_argument("--output-dir", default=os.getcwd())
+
+    load_parser = subparsers.add_parser("load", help="load a bundle")
+    load_parser.add_argument("path")
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == "build":
+            bundle_path = build_bundle(
+                args.version, args.role, args.images or IMAGE_CHOICES,
+                args.output_dir,
+            )
+            logger.info("bundle is saved to {}".format(bundle_path))
+        else:
+            load_bundle(args.path)
+            logger.info("bundle is loaded")
+    except (RuntimeError, IOError, OSError, KeyError) as exc:
+        logger.error(exc)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        logger.warn("bundle process aborted by user")
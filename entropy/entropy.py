@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Gluu
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import argparse
+import errno
+import json
+import logging
+import os
+import select
+import subprocess
+import sys
+import time
+
+ENTROPY_AVAIL = "/proc/sys/kernel/random/entropy_avail"
+POOLSIZE = "/proc/sys/kernel/random/poolsize"
+METRICS_FILE = "/var/log/gluu-entropy.json"
+RNGD_SERVICE = "rng-tools"
+MAX_WINDOWS = 20
+
+logger = logging.getLogger("entropy")
+logger.setLevel(logging.INFO)
+ch = logging.StreamHandler()
+fmt = logging.Formatter('[%(levelname)s] %(message)s')
+ch.setFormatter(fmt)
+logger.addHandler(ch)
+
+
+def safe_subprocess_exec(cmd):
+    """Runs shell command safely.
+
+    :param cmd: String of command.
+    """
+    cmdlist = cmd.strip().split()
+    ppn = subprocess.Popen(
+        cmdlist,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    out, err = ppn.communicate()
+    return out.strip(), err.strip(), ppn.returncode
+
+
+def rngd_running():
+    """Checks whether rngd process is running.
+    """
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open("/proc/{}/comm".format(pid)) as fp:
+                if fp.read().strip() == "rngd":
+                    return True
+        except IOError:
+            # process is gone
+            continue
+    return False
+
+
+class EntropyMonitor(object):
+    """Samples available entropy and tracks starvation windows.
+
+    Refill rate is estimated from the sum of positive changes between
+    samples, as neither the kernel nor rngd exposes a feed counter;
+    consumption happening between samples is not visible to it.
+
+    :param threshold: Entropy level (in bits) below which the pool is
+                      considered starved.
+    :param interval: Seconds between samples.
+    :param metrics_file: Path to JSON file where metrics are written.
+    :param max_windows: Number of recent starvation windows kept in metrics.
+    """
+
+    def __init__(self, threshold, interval, metrics_file,
+                 max_windows=MAX_WINDOWS):
+        self.threshold = threshold
+        self.interval = interval
+        self.metrics_file = metrics_file
+
+        # keep the proc file open; re-reading it is cheaper than re-opening
+        self.fp = open(ENTROPY_AVAIL)
+        self.last = self.sample()
+        self.last_time = time.time()
+        self.started_at = self.last_time
+
+        self.samples = 0
+        self.minimum = self.last
+        self.refilled_bits = 0
+        self.starvation = None
+        self.starvation_count = 0
+        self.starvation_seconds = 0.0
+        self.max_windows = max_windows
+        self.windows = []
+
+    def sample(self):
+        self.fp.seek(0)
+        return int(self.fp.read())
+
+    def tick(self):
+        now = time.time()
+        value = self.sample()
+        self.samples += 1
+        self.minimum = min(self.minimum, value)
+        if value > self.last:
+            self.refilled_bits += value - self.last
+
+        if value < self.threshold:
+            if self.starvation is None:
+                self.starvation = {"start": now, "minimum": value}
+                logger.warn("entropy starvation started; entropy_avail={}".format(value))  # noqa
+            else:
+                self.starvation["minimum"] = min(self.starvation["minimum"], value)  # noqa
+        elif self.starvation is not None:
+            self.end_starvation(now)
+
+        self.last = value
+        self.last_time = now
+
+    def end_starvation(self, now):
+        window = self.starvation
+        window["end"] = now
+        window["duration"] = round(now - window["start"], 3)
+        self.starvation = None
+        self.starvation_count += 1
+        self.starvation_seconds += window["duration"]
+        self.windows.append(window)
+        del self.windows[:-self.max_windows]
+        logger.warn(
+            "entropy starvation ended after {}s; minimum={}".format(
+                window["duration"], window["minimum"],
+            )
+        )
+
+    def metrics(self):
+        elapsed = max(self.last_time - self.started_at, 1e-6)
+        windows = list(self.windows)
+        starvation_seconds = self.starvation_seconds
+
+        # window still in progress is reported with its elapsed time
+        if self.starvation is not None:
+            current = dict(self.starvation)
+            current["end"] = None
+            current["duration"] = round(
+                self.last_time - current["start"], 3,
+            )
+            windows.append(current)
+            starvation_seconds += current["duration"]
+
+        return {
+            "timestamp": int(self.last_time),
+            "entropy_avail": self.last,
+            "entropy_min": self.minimum,
+            "threshold": self.threshold,
+            "samples": self.samples,
+            "refill_rate_bits": round(self.refilled_bits / elapsed, 2),
+            "rngd_running": rngd_running(),
+            "starved": self.starvation is not None,
+            "starvation_count": self.starvation_count,
+            "starvation_seconds": round(starvation_seconds, 3),
+            "starvation_windows": windows[-self.max_windows:],
+        }
+
+    def write_metrics(self):
+        # write to a temporary file first so readers never see partial data
+        tmp = "{}.tmp".format(self.metrics_file)
+        with open(tmp, "w") as fp:
+            json.dump(self.metrics(), fp, sort_keys=True)
+        os.rename(tmp, self.metrics_file)
+
+    def run(self, flush_every):
+        ticks = 0
+        while True:
+            time.sleep(self.interval)
+            self.tick()
+            ticks += 1
+            if ticks % flush_every == 0:
+                self.write_metrics()
+
+
+def read_latency(size, count, timeout):
+    """Measures latency of reading from ``/dev/random``.
+
+    :param size: Number of bytes per read.
+    :param count: Number of reads.
+    :param timeout: Seconds after which remaining reads are skipped.
+    """
+    latencies = []
+    timed_out = False
+    deadline = time.time() + timeout
+    # non-blocking, as another consumer may drain the pool between
+    # select() and read()
+    fd = os.open("/dev/random", os.O_RDONLY | os.O_NONBLOCK)
+    try:
+        for _ in range(count):
+            started = time.time()
+            remaining = size
+            while remaining > 0:
+                # reads from /dev/random block while the pool is starved,
+                # so wait for data only as long as the deadline allows
+                ready, _, _ = select.select(
+                    [fd], [], [], max(deadline - time.time(), 0),
+                )
+                if not ready:
+                    timed_out = True
+                    break
+                try:
+                    remaining -= len(os.read(fd, remaining))
+                except OSError as exc:
+                    if exc.errno != errno.EAGAIN:
+                        raise
+            if timed_out:
+                break
+            latencies.append(time.time() - started)
+    finally:
+        os.close(fd)
+
+    latencies.sort()
+    if not latencies:
+        return {"reads": 0, "timed_out": timed_out}
+    return {
+        "reads": len(latencies),
+        "timed_out": timed_out,
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+        "total_s": round(sum(latencies), 3),
+    }
+
+
+def benchmark(size, count, timeout):
+    """Compares ``/dev/random`` read latency without and with rngd.
+
+    :param size: Number of bytes per read.
+    :param count: Number of reads.
+    :param timeout: Seconds per round after which remaining reads are skipped.
+    """
+    def rngd_service(action):
+        _, err, returncode = safe_subprocess_exec(
+            "service {} {}".format(RNGD_SERVICE, action)
+        )
+        if returncode != 0:
+            logger.warn("unable to {} {}; reason={}".format(
+                action, RNGD_SERVICE, err,
+            ))
+
+    was_running = rngd_running()
+    result = {}
+    try:
+        for label, action in (("without_rngd", "stop"),
+                              ("with_rngd", "start")):
+            rngd_service(action)
+            # give the pool time to settle after rngd state change
+            time.sleep(2)
+            logger.info("reading /dev/random {}; rngd_running={}".format(
+                label, rngd_running(),
+            ))
+            result[label] = read_latency(size, count, timeout)
+    finally:
+        # leave rngd as it was before the benchmark
+        if rngd_running() != was_running:
+            rngd_service("start" if was_running else "stop")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Monitor entropy availability and rngd effectiveness",
+    )
+    parser.add_argument("--interval", type=float, default=1.0,
+                        help="seconds between entropy samples")
+    parser.add_argument("--threshold", type=int, default=200,
+                        help="entropy_avail below this is starvation")
+    parser.add_argument("--flush-every", type=int, default=10,
+                        help="write metrics every N samples")
+    parser.add_argument("--metrics-file", default=METRICS_FILE)
+    parser.add_argument("--max-windows", type=int, default=MAX_WINDOWS,
+                        help="number of recent starvation windows in metrics")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="measure /dev/random read latency without "
+                             "and with rngd, then exit")
+    parser.add_argument("--read-size", type=int, default=64)
+    parser.add_argument("--read-count", type=int, default=100)
+    parser.add_argument("--read-timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    if args.flush_every < 1:
+        parser.error("--flush-every must be at least 1")
+    if args.max_windows < 1:
+        parser.error("--max-windows must be at least 1")
+
+    if args.benchmark:
+        result = benchmark(args.read_size, args.read_count, args.read_timeout)
+        print json.dumps(result, indent=2, sort_keys=True)
+        return
+
+    with open(POOLSIZE) as fp:
+        poolsize = fp.read().strip()
+    logger.info("monitoring entropy every {}s; poolsize={} threshold={}".format(
+        args.interval, poolsize, args.threshold,
+    ))
+    monitor = EntropyMonitor(args.threshold, args.interval,
+                             args.metrics_file, args.max_windows)
+    monitor.run(args.flush_every)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        logger.warn("entropy monitor is stopped")
+    except (IOError, OSError) as exc:
+        logger.error("unable to run entropy monitor; reason={}".format(exc))
+        sys.exit(1)
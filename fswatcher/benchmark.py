@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Gluu
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# compares copy, compressed and delta transfer modes of fswatcher on
+# synthetic federation metadata; run it with the fswatcher virtualenv python
+
+import argparse
+import base64
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from fswatcher import TRANSFER_COMPRESSED
+from fswatcher import TRANSFER_COPY
+from fswatcher import TRANSFER_DELTA
+from fswatcher import apply_delta
+from fswatcher import copy_file
+from fswatcher import get_swarm_config
+from fswatcher import gzip_content
+from fswatcher import make_delta
+from fswatcher import send_compressed
+from fswatcher import send_delta
+
+ENTITY = """  <md:EntityDescriptor entityID="https://sp{index}.example.org/shibboleth">
+    <md:SPSSODescriptor protocolSupportEnumeration="urn:oasis:names:tc:SAML:2.0:protocol">
+      <md:KeyDescriptor>
+        <ds:KeyInfo><ds:X509Data><ds:X509Certificate>{cert}</ds:X509Certificate></ds:X509Data></ds:KeyInfo>
+      </md:KeyDescriptor>
+      <md:AssertionConsumerService Binding="urn:oasis:names:tc:SAML:2.0:bindings:HTTP-POST" Location="https://sp{index}.example.org/Shibboleth.sso/SAML2/POST" index="1"/>
+    </md:SPSSODescriptor>
+  </md:EntityDescriptor>
+"""
+
+
+def make_entity(rnd, index):
+    cert = base64.b64encode(
+        "{:01536x}".format(rnd.getrandbits(768 * 8)).decode("hex")
+    )
+    return ENTITY.format(index=index, cert=cert)
+
+
+def make_metadata(rnd, entities):
+    """Generates federation metadata as a list of entity blocks.
+
+    :param rnd: Instance of ``random.Random``.
+    :param entities: Number of entities.
+    """
+    return [make_entity(rnd, index) for index in range(entities)]
+
+
+def mutate(rnd, blocks, changes):
+    """Modifies, removes and adds a few entities, like a metadata refresh.
+
+    :param rnd: Instance of ``random.Random``.
+    :param blocks: List of entity blocks.
+    :param changes: Number of entities to change.
+    """
+    blocks = list(blocks)
+    for _ in range(changes):
+        pos = rnd.randrange(len(blocks))
+        action = rnd.choice(("modify", "remove", "add"))
+        if action == "modify":
+            blocks[pos] = make_entity(rnd, pos)
+        elif action == "remove":
+            del blocks[pos]
+        else:
+            blocks.insert(pos, make_entity(rnd, len(blocks) + pos))
+    return blocks
+
+
+def render(blocks):
+    return "".join([
+        '<?xml version="1.0" encoding="UTF-8"?>\n',
+        '<md:EntitiesDescriptor xmlns:md="urn:oasis:names:tc:SAML:2.0:metadata" '
+        'xmlns:ds="http://www.w3.org/2000/09/xmldsig#">\n',
+    ] + blocks + ["</md:EntitiesDescriptor>\n"])
+
+
+def encode(mode, basis, content):
+    started = time.time()
+    if mode == TRANSFER_COMPRESSED:
+        payload = gzip_content(content)
+    elif mode == TRANSFER_DELTA:
+        payload = make_delta(basis, content)
+        if payload is None:
+            # fswatcher falls back to compressed transfer, so does this;
+            # time spent on the abandoned delta is kept
+            mode, payload = TRANSFER_COMPRESSED, gzip_content(content)
+    else:
+        payload = content
+    elapsed = time.time() - started
+
+    if mode == TRANSFER_DELTA and apply_delta(basis, payload) != content:
+        raise RuntimeError("delta doesn't reproduce content")
+    return mode, payload, elapsed
+
+
+def transfer(docker, mode, path, payload, container, dest):
+    started = time.time()
+    if mode == TRANSFER_COMPRESSED:
+        ok, err = send_compressed(docker, payload, container, dest,
+                                  os.stat(path).st_mode)
+    elif mode == TRANSFER_DELTA:
+        ok, err = send_delta(docker, payload, container, dest)
+    else:
+        ok, err = copy_file(docker, path, container, dest)
+    if not ok:
+        raise RuntimeError("{} transfer failed; reason={}".format(mode, err))
+    return time.time() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark fswatcher transfer modes",
+    )
+    parser.add_argument("--entities", type=int, default=10000,
+                        help="number of entities in synthetic metadata")
+    parser.add_argument("--changes", type=int, default=20,
+                        help="number of entities changed between versions")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--container",
+                        help="also measure transfer time into this container")
+    parser.add_argument("--dest", default="/tmp/fswatcher-benchmark.xml",
+                        help="path inside container")
+    parser.add_argument("--local", action="store_true",
+                        help="use local docker daemon instead of swarm")
+    parser.add_argument("--output", help="path to JSON result")
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    blocks = make_metadata(rnd, args.entities)
+    basis = render(blocks)
+    content = render(mutate(rnd, blocks, args.changes))
+
+    docker = ["docker"]
+    if not args.local:
+        docker += get_swarm_config().split()
+
+    workdir = tempfile.mkdtemp(prefix="fswatcher-benchmark-")
+    basis_path = os.path.join(workdir, "basis.xml")
+    content_path = os.path.join(workdir, "content.xml")
+    for path, data in ((basis_path, basis), (content_path, content)):
+        with open(path, "wb") as fp:
+            fp.write(data)
+
+    results = []
+    try:
+        for mode in (TRANSFER_COPY, TRANSFER_COMPRESSED, TRANSFER_DELTA):
+            sent_as, payload, encode_time = encode(mode, basis, content)
+            item = {
+                "mode": mode,
+                "sent_as": sent_as,
+                "size": len(content),
+                "sent": len(payload),
+                "ratio": round(float(len(payload)) / len(content), 4),
+                "encode_s": round(encode_time, 3),
+            }
+
+            if args.container:
+                # put basis in place first, so delta has something to patch
+                transfer(docker, TRANSFER_COPY, basis_path, None,
+                         args.container, args.dest)
+                transfer_time = transfer(
+                    docker, sent_as, content_path, payload,
+                    args.container, args.dest,
+                )
+                item["transfer_s"] = round(transfer_time, 3)
+                # end to end time, as seen by a rule worker
+                item["total_s"] = round(encode_time + transfer_time, 3)
+            results.append(item)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    columns = ["mode", "sent_as", "size", "sent", "ratio", "encode_s"]
+    if args.container:
+        columns.extend(["transfer_s", "total_s"])
+    print "  ".join("{:>12}".format(col) for col in columns)
+    for item in results:
+        print "  ".join("{:>12}".format(item[col]) for col in columns)
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -22,11 +22,23 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import argparse
+import fnmatch
+import gzip
+import hashlib
+import inspect
+import io
 import json
 import logging
+import math
 import os
+import shutil
+import struct
+import sys
+import threading
 import time
 import subprocess
+import zlib
 
 from watchdog.observers import Observer
 from watchdog.events import PatternMatchingEventHandler
@@ -35,6 +47,31 @@ WATCHED_DIRECTORY = "/opt/idp"
 DOCKER_CERT_DIR = "/opt/gluu/docker/certs"
 DATABASE_URI = "/var/lib/gluuengine/db/shared.json"
 DATABASE_URI_COMPAT = "/var/lib/gluu-cluster/db/shared.json"
+CONFIG_FILE = "/etc/gluu/fswatcher.json"
+CACHE_DIR = "/var/lib/gluu-fswatcher/cache"
+
+# transfer modes; `compressed` and `delta` stream data through `docker exec`
+TRANSFER_COPY = "copy"
+TRANSFER_COMPRESSED = "compressed"
+TRANSFER_DELTA = "delta"
+TRANSFER_CHOICES = (TRANSFER_COPY, TRANSFER_COMPRESSED, TRANSFER_DELTA,)
+DELTA_MIN_SIZE = 1024 * 1024
+# delta is abandoned in favor of compressed transfer once unmatched bytes
+# exceed this fraction of content, or encoding takes longer than this
+DELTA_MAX_LITERAL = 0.5
+DELTA_MAX_SECONDS = 2.0
+
+# used when config file is missing; mirrors the original oxidp-only behavior
+DEFAULT_RULES = [
+    {
+        "name": "oxidp",
+        "source": WATCHED_DIRECTORY,
+        "patterns": ["*.xml", "*.config", "*.xsd", "*.dtd"],
+        "container_type": "oxidp",
+        "states": ["SUCCESS", "DISABLED"],
+        "destination": WATCHED_DIRECTORY,
+    },
+]
 
 logger = logging.getLogger("fswatcher")
 logger.setLevel(logging.INFO)
@@ -68,86 +105,687 @@ def safe_subprocess_exec(cmd):
     return out.strip(), err.strip(), ppn.returncode
 
 
-class OxidpHandler(PatternMatchingEventHandler):
-    patterns = ("*.xml", "*.config", "*.xsd", "*.dtd",)
+def exec_with_input(cmdlist, data):
+    """Runs command and feeds data into its stdin.
 
-    def on_any_event(self, event):
-        logger.info("got {!r} event for {!r}".format(
-            event.event_type, event.src_path,
-        ))
+    :param cmdlist: List of command arguments.
+    :param data: Bytes sent to stdin.
+    """
+    ppn = subprocess.Popen(
+        cmdlist,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    out, err = ppn.communicate(data)
+    return out.strip(), err.strip(), ppn.returncode
 
-    def on_modified(self, event):
-        self.copy_path(event)
 
-    def on_created(self, event):
-        self.copy_path(event)
+def block_size_for(length):
+    """Picks delta block size for a file, similar to rsync's sqrt heuristic.
 
-    def on_moved(self, event):
-        self.copy_path(event)
+    :param length: Size of the file.
+    """
+    return min(max(int(math.sqrt(length)) // 64 * 64, 1024), 65536)
 
-    def copy_path(self, event):
-        src = event.src_path
-        dest = event.src_path
 
-        if event.event_type == "moved":
-            # source is the moved path
-            src = event.dest_path
-            dest = event.dest_path
+def make_delta(basis, content, max_literal=DELTA_MAX_LITERAL,
+               max_seconds=DELTA_MAX_SECONDS):
+    """Encodes content as a delta against basis using rolling checksums.
 
-        swarm_config = get_swarm_config()
+    Full blocks of basis are indexed by their adler32 (weak) and md5
+    (strong) checksums; content is scanned with a rolling adler32 and
+    matching blocks are replaced by references to basis. The encoded
+    delta is zlib-compressed.
 
-        for container in self._get_oxidp_containers():
-            logger.info(
-                "found oxidp container with ID {}".format(container["cid"])
-            )
+    Returns ``None`` if content differs too much from basis to be worth
+    a delta, i.e. unmatched bytes exceed ``max_literal`` of content size
+    or scanning takes longer than ``max_seconds``.
 
-            logger.info(
-                "copying {} to {}:{}".format(src, container["cid"], dest)
+    :param basis: Bytes already present at the receiver.
+    :param content: New bytes.
+    :param max_literal: Fraction of content allowed to be sent as is.
+    :param max_seconds: Time allowed for scanning content.
+    """
+    deadline = time.time() + max_seconds
+    block_size = block_size_for(len(basis))
+    signature = {}
+    for index in range(len(basis) // block_size):
+        block = basis[index * block_size:(index + 1) * block_size]
+        weak = zlib.adler32(block) & 0xffffffff
+        signature.setdefault(weak, []).append(
+            (hashlib.md5(block).digest(), index)
+        )
+
+    data = bytearray(content)
+    ops = []
+    literal_start = 0
+    literal = 0
+    limit = int(len(content) * max_literal)
+    rolled = 0
+    pos = 0
+    weak = None
+    end = len(content)
+
+    while pos + block_size <= end:
+        window = content[pos:pos + block_size]
+        if weak is None:
+            weak = zlib.adler32(window) & 0xffffffff
+
+        match = None
+        if weak in signature:
+            strong = hashlib.md5(window).digest()
+            for candidate, index in signature[weak]:
+                if candidate == strong:
+                    match = index
+                    break
+
+        if match is not None:
+            if literal_start < pos:
+                ops.append(("D", content[literal_start:pos]))
+                literal += pos - literal_start
+            if ops and ops[-1][0] == "C" and ops[-1][1] + ops[-1][2] == match:
+                ops[-1] = ("C", ops[-1][1], ops[-1][2] + 1)
+            else:
+                ops.append(("C", match, 1))
+            pos += block_size
+            literal_start = pos
+            weak = None
+            continue
+
+        # byte at `pos` is sent as is
+        if literal + pos + 1 - literal_start > limit:
+            return None
+        rolled += 1
+        if not rolled & 0xffff and time.time() > deadline:
+            return None
+
+        # roll the window by one byte
+        if pos + block_size < end:
+            a = weak & 0xffff
+            b = weak >> 16
+            out, inc = data[pos], data[pos + block_size]
+            a = (a - out + inc) % 65521
+            b = (b - block_size * out + a - 1) % 65521
+            weak = (b << 16) | a
+        pos += 1
+
+    if literal + end - literal_start > limit:
+        return None
+    if literal_start < end:
+        ops.append(("D", content[literal_start:]))
+
+    chunks = [struct.pack(
+        ">I32s32s", block_size,
+        hashlib.sha256(basis).digest(), hashlib.sha256(content).digest(),
+    )]
+    for op in ops:
+        if op[0] == "C":
+            chunks.append(struct.pack(">cII", b"C", op[1], op[2]))
+        else:
+            chunks.append(struct.pack(">cI", b"D", len(op[1])))
+            chunks.append(op[1])
+    return zlib.compress(b"".join(chunks), 6)
+
+
+def apply_delta(basis, payload):
+    """Rebuilds content from basis and delta made by ``make_delta``.
+
+    Returns ``None`` if basis or result doesn't match checksums in delta.
+    This function is also sent to containers, so it must not depend on
+    anything outside its body.
+
+    :param basis: Bytes present at the receiver.
+    :param payload: Delta made by ``make_delta``.
+    """
+    import hashlib
+    import struct
+    import zlib
+
+    data = zlib.decompress(payload)
+    block_size, basis_digest, content_digest = struct.unpack(
+        ">I32s32s", data[:68]
+    )
+    if hashlib.sha256(basis).digest() != basis_digest:
+        return None
+
+    chunks = []
+    pos = 68
+    while pos < len(data):
+        op = data[pos:pos + 1]
+        if op == b"C":
+            start, count = struct.unpack(">II", data[pos + 1:pos + 9])
+            chunks.append(
+                basis[start * block_size:(start + count) * block_size]
             )
+            pos += 9
+        else:
+            length, = struct.unpack(">I", data[pos + 1:pos + 5])
+            chunks.append(data[pos + 5:pos + 5 + length])
+            pos += 5 + length
+
+    content = b"".join(chunks)
+    if hashlib.sha256(content).digest() != content_digest:
+        return None
+    return content
+
+
+# runs inside container; reads delta from stdin and patches file in place
+APPLIER_MAIN = """
+import os, sys
+dest = sys.argv[1]
+stdin = getattr(sys.stdin, "buffer", sys.stdin)
+with open(dest, "rb") as fp:
+    content = apply_delta(fp.read(), stdin.read())
+if content is None:
+    sys.exit(3)
+os.umask(0o077)
+tmp = dest + ".fswatcher"
+with open(tmp, "wb") as fp:
+    fp.write(content)
+os.chmod(tmp, os.stat(dest).st_mode & 0o7777)
+os.rename(tmp, dest)
+"""
+APPLIER_SCRIPT = inspect.getsource(apply_delta) + APPLIER_MAIN
+
+# `$0` and `$1` are the first arguments after the script; passing data this
+# way avoids quoting it for the shell; temporary files are created private
+# and get their final mode before being moved into place
+DELTA_SHELL = 'for py in python3 python; do ' \
+              'command -v $py >/dev/null && exec $py -c "$0" "$1"; ' \
+              'done; exit 127'
+COMPRESSED_SHELL = 'mkdir -p "$(dirname "$0")" && umask 077 && ' \
+                   'gzip -dc > "$0.fswatcher" && ' \
+                   'chmod "$1" "$0.fswatcher" && mv "$0.fswatcher" "$0"'
+
+
+def gzip_content(content):
+    """Compresses content in gzip format.
+
+    :param content: Bytes to compress.
+    """
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode="wb", compresslevel=6) as fp:
+        fp.write(content)
+    return buf.getvalue()
+
+
+def copy_file(docker, src, cid, dest):
+    """Copies file into container using ``docker cp``.
+
+    :param docker: List of docker command and its global options.
+    :param src: Path to the file.
+    :param cid: ID of the container.
+    :param dest: Path inside container.
+    """
+    _, err, returncode = exec_with_input(
+        docker + ["cp", src, "{}:{}".format(cid, dest)], b"",
+    )
+    return returncode == 0, err
+
+
+def send_compressed(docker, payload, cid, dest, mode):
+    """Streams gzip-compressed file into container.
+
+    :param docker: List of docker command and its global options.
+    :param payload: Output of ``gzip_content``.
+    :param cid: ID of the container.
+    :param dest: Path inside container.
+    :param mode: Permission bits of the file, like ``docker cp`` keeps them.
+    """
+    _, err, returncode = exec_with_input(
+        docker + ["exec", "-i", cid, "sh", "-c", COMPRESSED_SHELL, dest,
+                  "{:o}".format(mode & 0o7777)],
+        payload,
+    )
+    return returncode == 0, err
+
+
+def send_delta(docker, payload, cid, dest):
+    """Streams delta into container and patches the file there.
+
+    :param docker: List of docker command and its global options.
+    :param payload: Output of ``make_delta``.
+    :param cid: ID of the container.
+    :param dest: Path inside container.
+    """
+    _, err, returncode = exec_with_input(
+        docker + ["exec", "-i", cid, "sh", "-c", DELTA_SHELL,
+                  APPLIER_SCRIPT, dest],
+        payload,
+    )
+    return returncode == 0, err
+
+
+class BasisCache(object):
+    """Keeps the last content delivered to each container.
+
+    Entries of containers no longer in cluster database are removed by
+    ``prune``.
+
+    :param path: Directory where cached files are stored.
+    """
+
+    def __init__(self, path=CACHE_DIR):
+        self.path = path
+
+    def _path(self, cid, dest):
+        return os.path.join(
+            self.path, cid, hashlib.sha1(dest.encode("utf-8")).hexdigest(),
+        )
+
+    def get(self, cid, dest):
+        try:
+            with open(self._path(cid, dest), "rb") as fp:
+                return fp.read()
+        except IOError:
+            return None
+
+    def set(self, cid, dest, content):
+        path = self._path(cid, dest)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+
+        tmp = "{}.tmp".format(path)
+        with open(tmp, "wb") as fp:
+            fp.write(content)
+        os.rename(tmp, path)
+
+    def discard(self, cid, dest):
+        try:
+            os.unlink(self._path(cid, dest))
+        except OSError:
+            pass
+
+    def prune(self, cids):
+        """Removes cached files of containers not in ``cids``.
+
+        :param cids: IDs of existing containers.
+        """
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return
+        for name in names:
+            if name not in cids:
+                shutil.rmtree(os.path.join(self.path, name),
+                              ignore_errors=True)
+
+
+def load_rules(path):
+    """Loads sync rules from JSON config file.
+
+    Falls back to ``DEFAULT_RULES`` if config file doesn't exist.
+
+    :param path: Path to config file.
+    """
+    if not os.path.exists(path):
+        logger.info("{} not found; using default rules".format(path))
+        return [Rule(**item) for item in DEFAULT_RULES]
+
+    with open(path) as fp:
+        data = json.loads(fp.read())
+    return [Rule(**item) for item in data["rules"]]
+
+
+class Rule(object):
+    """Maps a source tree to a destination path inside containers.
+
+    :param name: Name of the rule.
+    :param source: Watched directory.
+    :param patterns: Glob patterns of files to sync.
+    :param container_type: Type of target containers.
+    :param destination: Directory inside containers mapped to ``source``.
+    :param states: Container states eligible for sync.
+    :param workers: Number of concurrent copy workers.
+    :param rate: Max copies per second; 0 means unlimited.
+    :param transfer: One of ``copy``, ``compressed`` or ``delta``.
+    :param delta_min_size: Files smaller than this are sent compressed
+                           even in ``delta`` mode.
+    """
+
+    def __init__(self, name, source, patterns, container_type, destination,
+                 states=("SUCCESS", "DISABLED",), workers=2, rate=0,
+                 transfer=TRANSFER_COPY, delta_min_size=DELTA_MIN_SIZE):
+        if transfer not in TRANSFER_CHOICES:
+            raise ValueError("unknown transfer {!r} of rule {}; must be one "
+                             "of {}".format(transfer, name,
+                                            ", ".join(TRANSFER_CHOICES)))
+        if rate < 0:
+            raise ValueError("rate of rule {} must not be negative".format(
+                name,
+            ))
+        if workers < 1:
+            raise ValueError("workers of rule {} must be at least 1".format(
+                name,
+            ))
+
+        self.name = name
+        self.source = os.path.abspath(source)
+        self.patterns = list(patterns)
+        self.container_type = container_type
+        self.destination = destination
+        self.states = tuple(states)
+        self.workers = workers
+        self.rate = rate
+        self.transfer = transfer
+        self.delta_min_size = delta_min_size
+
+    def dest_path(self, src):
+        return os.path.join(
+            self.destination, os.path.relpath(src, self.source),
+        )
+
+    def matches(self, container):
+        return (container["type"] == self.container_type and
+                container["state"] in self.states)
+
+
+class ContainerRegistry(object):
+    """Shared, cached view of containers stored in cluster database.
+
+    Database is re-read only when its modification time changes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.mtime = None
+        self.containers = []
+
+    def _database_uri(self):
+        for path in (DATABASE_URI, DATABASE_URI_COMPAT):
+            if os.path.exists(path):
+                return path
+        return ""
+
+    def _load(self):
+        path = self._database_uri()
+        if not path:
+            logger.warn("unable to read {} or {}".format(DATABASE_URI, DATABASE_URI_COMPAT))  # noqa
+            return None
+
+        with self.lock:
+            mtime = os.path.getmtime(path)
+            if mtime != self.mtime:
+                with open(path) as fp:
+                    data = json.loads(fp.read())
+                self.containers = [
+                    item for _, item in data.get("containers", {}).iteritems()
+                ]
+                self.mtime = mtime
+            return self.containers
+
+    def get_containers(self, rule):
+        containers = self._load() or []
+        return [item for item in containers if rule.matches(item)]
+
+    def container_ids(self):
+        """Returns IDs of all known containers, or ``None`` if database
+        can't be read.
+        """
+        containers = self._load()
+        if containers is None:
+            return None
+        return set(item["cid"] for item in containers if item.get("cid"))
+
+
+class RateLimiter(object):
+    """Token bucket allowing ``rate`` operations per second.
+
+    Bucket holds at least one token, so rates below 1 still let an
+    operation through every ``1 / rate`` seconds.
+
+    :param rate: Operations per second; 0 means unlimited.
+    """
+
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self.capacity = max(self.rate, 1.0)
+        self.tokens = self.capacity
+        self.updated_at = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (now - self.updated_at) * self.rate,
+                )
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class RuleWorker(object):
+    """Copies changed files of a rule using its own pool of threads.
+
+    Paths already waiting in the queue are not queued twice, so a burst
+    of events for the same file results in a single copy. A path is never
+    copied by two threads at once; events arriving while it is being
+    copied mark it dirty, and it is queued again once the copy finishes.
+
+    :param rule: Instance of ``Rule``.
+    :param registry: Instance of ``ContainerRegistry``.
+    """
+
+    def __init__(self, rule, registry, cache=None):
+        self.rule = rule
+        self.registry = registry
+        self.cache = cache or BasisCache()
+        self.limiter = RateLimiter(rule.rate)
+        self.cond = threading.Condition()
+        self.queue = []
+        self.pending = set()
+        self.in_flight = set()
+        self.dirty = set()
+        self.swarm_config = get_swarm_config()
+        self.docker = ["docker"] + self.swarm_config.split()
+
+    def start(self):
+        for _ in range(self.rule.workers):
+            thread = threading.Thread(target=self._run)
+            thread.daemon = True
+            thread.start()
+
+    def submit(self, src):
+        with self.cond:
+            if src in self.in_flight:
+                self.dirty.add(src)
+                return
+            self._enqueue(src)
+
+    def _enqueue(self, src):
+        # must be called with `self.cond` held
+        if src in self.pending:
+            return
+        self.pending.add(src)
+        self.queue.append(src)
+        self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.queue:
+                    self.cond.wait()
+                src = self.queue.pop(0)
+                self.pending.discard(src)
+                self.in_flight.add(src)
+
+            try:
+                self.copy_path(src)
+            except Exception as exc:
+                logger.error("[{}] unable to sync {}; reason={}".format(
+                    self.rule.name, src, exc,
+                ))
+            finally:
+                with self.cond:
+                    self.in_flight.discard(src)
+                    if src in self.dirty:
+                        self.dirty.discard(src)
+                        self._enqueue(src)
+
+    def copy_path(self, src):
+        if self.rule.transfer != TRANSFER_COPY:
+            return self.stream_path(src)
+
+        dest = self.rule.dest_path(src)
+
+        for container in self.registry.get_containers(self.rule):
+            self.limiter.acquire()
+            logger.info("[{}] copying {} to {}:{}".format(
+                self.rule.name, src, container["cid"], dest,
+            ))
             _, err, returncode = safe_subprocess_exec(
                 "docker {} cp {} {}:{}".format(
-                    swarm_config, src, container["cid"], dest,
+                    self.swarm_config, src, container["cid"], dest,
                 )
             )
 
             if returncode != 0:
                 logger.warn(
-                    "error while copying {} to {}:{}; reason={}".format(
-                        src, container["cid"], dest, err,
+                    "[{}] error while copying {} to {}:{}; reason={}".format(
+                        self.rule.name, src, container["cid"], dest, err,
                     )
                 )
 
-    def _get_oxidp_containers(self):
-        data = []
+    def stream_path(self, src):
+        dest = self.rule.dest_path(src)
+        with open(src, "rb") as fp:
+            content = fp.read()
+            file_mode = os.fstat(fp.fileno()).st_mode
 
-        if not any(map(os.path.exists, [DATABASE_URI, DATABASE_URI_COMPAT])):
-            logger.warn("unable to read {} or {}".format(DATABASE_URI, DATABASE_URI_COMPAT))  # noqa
+        if self.rule.transfer == TRANSFER_DELTA:
+            cids = self.registry.container_ids()
+            if cids is not None:
+                self.cache.prune(cids)
+
+        # payloads are shared by containers with the same basis
+        compressed = []
+        deltas = {}
+
+        for container in self.registry.get_containers(self.rule):
+            self.limiter.acquire()
+            cid = container["cid"]
+            started = time.time()
+            mode, sent, ok, err = None, 0, False, ""
+
+            basis = None
+            if (self.rule.transfer == TRANSFER_DELTA and
+                    len(content) >= self.rule.delta_min_size):
+                basis = self.cache.get(cid, dest)
+
+            if basis is not None and None not in deltas.values():
+                key = hashlib.sha256(basis).digest()
+                if key not in deltas:
+                    deltas[key] = make_delta(basis, content)
+                    if deltas[key] is None:
+                        # other bases are unlikely to do better; don't
+                        # spend another scan on them
+                        logger.info(
+                            "[{}] {} changed too much for delta; sending "
+                            "it compressed".format(self.rule.name, src)
+                        )
+
+                if deltas[key] is not None:
+                    mode, sent = TRANSFER_DELTA, len(deltas[key])
+                    ok, err = send_delta(self.docker, deltas[key], cid, dest)
+
+            if not ok:
+                if not compressed:
+                    compressed.append(gzip_content(content))
+                mode, sent = TRANSFER_COMPRESSED, len(compressed[0])
+                ok, err = send_compressed(
+                    self.docker, compressed[0], cid, dest, file_mode,
+                )
+
+            if not ok:
+                # container may lack gzip; plain copy always works
+                mode, sent = TRANSFER_COPY, len(content)
+                ok, err = copy_file(self.docker, src, cid, dest)
+
+            if not ok:
+                self.cache.discard(cid, dest)
+                logger.warn(
+                    "[{}] error while copying {} to {}:{}; reason={}".format(
+                        self.rule.name, src, cid, dest, err,
+                    )
+                )
+                continue
+
+            if self.rule.transfer == TRANSFER_DELTA:
+                self.cache.set(cid, dest, content)
+            logger.info(
+                "[{}] copied {} to {}:{} using {} transfer; "
+                "sent={} size={} elapsed={:.3f}s".format(
+                    self.rule.name, src, cid, dest, mode, sent,
+                    len(content), time.time() - started,
+                )
+            )
+
+
+class RuleHandler(PatternMatchingEventHandler):
+    def __init__(self, worker):
+        super(RuleHandler, self).__init__(patterns=worker.rule.patterns)
+        self.worker = worker
+
+    def on_any_event(self, event):
+        logger.info("[{}] got {!r} event for {!r}".format(
+            self.worker.rule.name, event.event_type, event.src_path,
+        ))
+
+    def on_modified(self, event):
+        self.worker.submit(event.src_path)
+
+    def on_created(self, event):
+        self.worker.submit(event.src_path)
+
+    def on_moved(self, event):
+        # only sync moved file if it stays inside watched directory
+        # and its new name matches the patterns
+        dest = event.dest_path
+        if not dest.startswith(self.worker.rule.source + os.sep):
             return
+        if any(fnmatch.fnmatch(dest, pattern)
+               for pattern in self.worker.rule.patterns):
+            self.worker.submit(dest)
 
-        with open(DATABASE_URI) as fp:
-            data = json.loads(fp.read())
 
-        containers = [
-            item for _, item in data["containers"].iteritems()
-            if (item["type"] == "oxidp" and
-                item["state"] in ("SUCCESS", "DISABLED",))
-        ]
-        return containers
+def main():
+    parser = argparse.ArgumentParser(description="Sync files into containers")
+    parser.add_argument("--config", default=CONFIG_FILE)
+    args = parser.parse_args()
 
+    try:
+        rules = load_rules(args.config)
+    except (ValueError, TypeError, KeyError) as exc:
+        logger.error("unable to load rules from {}; reason={}".format(
+            args.config, exc,
+        ))
+        sys.exit(1)
+    registry = ContainerRegistry()
+    observer = Observer()
 
-if __name__ == "__main__":
-    logger.info("running fswatcher on {}".format(WATCHED_DIRECTORY))
+    for rule in rules:
+        logger.info("running fswatcher rule {} on {}".format(
+            rule.name, rule.source,
+        ))
+        if not os.path.exists(rule.source):
+            os.makedirs(rule.source)
 
-    if not os.path.exists(WATCHED_DIRECTORY):
-        os.makedirs(WATCHED_DIRECTORY)
+        worker = RuleWorker(rule, registry)
+        worker.start()
+        observer.schedule(RuleHandler(worker), path=rule.source,
+                          recursive=True)
 
     try:
-        observer = Observer()
-        observer.schedule(
-            OxidpHandler(),
-            path=WATCHED_DIRECTORY,
-            recursive=True,
-        )
         observer.start()
     except OSError as exc:
         logger.error("unable to run fswatcher; reason={}".format(exc))
@@ -162,3 +800,7 @@ if __name__ == "__main__":
             observer.stop()
             logger.warn("fswatcher is stopped")
         observer.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Gluu
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import argparse
+import json
+import logging
+import os
+import Queue
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+DOCKER_CERT_DIR = "/opt/gluu/docker/certs"
+DATABASE_URI = "/var/lib/gluuengine/db/shared.json"
+DATABASE_URI_COMPAT = "/var/lib/gluu-cluster/db/shared.json"
+TIMEOUT = "timeout"
+
+logger = logging.getLogger("cluster-status")
+logger.setLevel(logging.INFO)
+ch = logging.StreamHandler()
+fmt = logging.Formatter('[%(levelname)s] %(message)s')
+ch.setFormatter(fmt)
+logger.addHandler(ch)
+
+
+class ProbeTimeout(Exception):
+    pass
+
+
+def get_swarm_config():
+    get_cert_path = lambda path: os.path.join(DOCKER_CERT_DIR, path)
+    config = " ".join([
+        "-H tcp://:3376",
+        "--tlsverify",
+        "--tlscacert={}".format(get_cert_path("ca.pem")),
+        "--tlscert={}".format(get_cert_path("cert.pem")),
+        "--tlskey={}".format(get_cert_path("key.pem")),
+    ])
+    return config
+
+
+def load_database():
+    """Loads JSON-based database as Python object.
+    """
+    data = {}
+
+    paths = filter(os.path.exists, [DATABASE_URI, DATABASE_URI_COMPAT])
+    if not paths:
+        logger.warn("unable to read {} or {}".format(DATABASE_URI, DATABASE_URI_COMPAT))  # noqa
+        sys.exit(1)
+
+    with open(paths[0]) as fp:
+        data = json.loads(fp.read())
+    return data
+
+
+def timed_subprocess_exec(cmd, timeout):
+    """Runs shell command and kills it if it runs longer than timeout.
+
+    :param cmd: String of command.
+    :param timeout: Seconds before the command is killed.
+    """
+    cmdlist = cmd.strip().split()
+    ppn = subprocess.Popen(
+        cmdlist,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        # own process group, so children holding the pipes are killed too
+        preexec_fn=os.setsid,
+    )
+    killed = []
+
+    def kill():
+        killed.append(True)
+        try:
+            os.killpg(ppn.pid, signal.SIGKILL)
+        except OSError:
+            # process already finished
+            pass
+
+    timer = threading.Timer(timeout, kill)
+    timer.start()
+    try:
+        out, err = ppn.communicate()
+    finally:
+        timer.cancel()
+
+    if killed:
+        raise ProbeTimeout(cmd)
+    return out.strip(), err.strip(), ppn.returncode
+
+
+def parse_weave_dns(out):
+    """Maps short container ID to hostnames registered in weavedns.
+
+    :param out: Output of ``weave status dns``.
+    """
+    entries = {}
+    for line in out.splitlines():
+        parts = line.split()
+        if len(parts) < 3:
+            continue
+        hostname, _, cid = parts[:3]
+        entries.setdefault(cid[:12], []).append(hostname)
+    return entries
+
+
+def parse_supervisor(out):
+    """Maps supervisor program names to their states.
+
+    :param out: Output of ``supervisorctl status``.
+    """
+    programs = {}
+    for line in out.splitlines():
+        parts = line.split()
+        if len(parts) >= 2:
+            programs[parts[0]] = parts[1]
+    return programs
+
+
+class Prober(object):
+    """Probes docker and supervisor state of containers.
+
+    :param docker_config: Extra ``docker`` options, e.g. swarm config.
+    :param timeout: Seconds allowed for each command.
+    """
+
+    def __init__(self, docker_config, timeout):
+        self.docker = "docker {}".format(docker_config).strip()
+        self.timeout = timeout
+
+    def weave_dns(self):
+        try:
+            out, _, returncode = timed_subprocess_exec(
+                "weave status dns", self.timeout,
+            )
+        except (ProbeTimeout, OSError):
+            return None
+        if returncode != 0:
+            return None
+        return parse_weave_dns(out)
+
+    def probe(self, container):
+        result = {"docker": "unknown", "supervisor": {}}
+        cid = container["cid"]
+
+        try:
+            out, err, returncode = timed_subprocess_exec(
+                "{} inspect -f {{{{.State.Status}}}} {}".format(self.docker, cid),  # noqa
+                self.timeout,
+            )
+        except ProbeTimeout:
+            result["docker"] = TIMEOUT
+            return result
+
+        if returncode != 0:
+            result["docker"] = "missing" if "No such" in err else "error"
+            return result
+        result["docker"] = out
+
+        if out != "running":
+            return result
+
+        try:
+            out, _, _ = timed_subprocess_exec(
+                "{} exec {} supervisorctl status".format(self.docker, cid),
+                self.timeout,
+            )
+            result["supervisor"] = parse_supervisor(out)
+        except ProbeTimeout:
+            result["supervisor"] = TIMEOUT
+        return result
+
+
+def probe_all(prober, containers, workers, budget):
+    """Probes containers concurrently within a time budget.
+
+    Containers which are not probed before the budget runs out are
+    reported as timed out.
+
+    :param prober: Instance of ``Prober``.
+    :param containers: List of containers taken from database.
+    :param workers: Number of concurrent probes.
+    :param budget: Seconds allowed for the whole report.
+    """
+    deadline = time.time() + budget
+    tasks = Queue.Queue()
+    results = {}
+    lock = threading.Lock()
+
+    for container in containers:
+        tasks.put(container)
+
+    def worker():
+        while time.time() < deadline:
+            try:
+                container = tasks.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                result = prober.probe(container)
+            except Exception as exc:
+                result = {"docker": "error: {}".format(exc), "supervisor": {}}
+            with lock:
+                results[container["id"]] = result
+
+    threads = []
+    for _ in range(min(workers, len(containers)) or 1):
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+
+    # weavedns entries are replicated, so one lookup covers all nodes
+    dns = prober.weave_dns()
+
+    for thread in threads:
+        thread.join(max(deadline - time.time(), 0))
+
+    with lock:
+        snapshot = dict(results)
+
+    report = []
+    for container in containers:
+        result = snapshot.get(container["id"],
+                              {"docker": TIMEOUT, "supervisor": TIMEOUT})
+        if dns is None:
+            dns_entries = "unknown"
+        else:
+            dns_entries = dns.get(container["cid"][:12], [])
+        report.append({
+            "node": container.get("node_name", ""),
+            "type": container["type"],
+            "name": container["name"],
+            "cid": container["cid"][:12],
+            "state": container["state"],
+            "docker": result["docker"],
+            "supervisor": result["supervisor"],
+            "dns": dns_entries,
+        })
+    return report
+
+
+def format_supervisor(programs):
+    if not isinstance(programs, dict):
+        return programs
+    if not programs:
+        return "-"
+    failed = ["{}:{}".format(name, state)
+              for name, state in sorted(programs.iteritems())
+              if state != "RUNNING"]
+    return ",".join(failed) or "all RUNNING"
+
+
+def format_table(report):
+    columns = ("node", "type", "name", "cid", "state", "docker",
+               "supervisor", "dns")
+    rows = []
+    for item in report:
+        row = dict(item)
+        row["supervisor"] = format_supervisor(item["supervisor"])
+        if isinstance(item["dns"], list):
+            row["dns"] = ",".join(item["dns"]) or "-"
+        rows.append([str(row[col]) for col in columns])
+
+    widths = [max([len(col)] + [len(row[idx]) for row in rows])
+              for idx, col in enumerate(columns)]
+    lines = ["  ".join(col.upper().ljust(widths[idx])
+                       for idx, col in enumerate(columns))]
+    for row in rows:
+        lines.append("  ".join(value.ljust(widths[idx])
+                               for idx, value in enumerate(row)))
+    return "\n".join(line.rstrip() for line in lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Show status of all containers in the cluster",
+    )
+    parser.add_argument("--json", action="store_true",
+                        help="print report as JSON")
+    parser.add_argument("--budget", type=float, default=15,
+                        help="seconds allowed for the whole report")
+    parser.add_argument("--timeout", type=float, default=5,
+                        help="seconds allowed for each probe command")
+    parser.add_argument("--workers", type=int, default=32,
+                        help="number of concurrent probes")
+    parser.add_argument("--local", action="store_true",
+                        help="use local docker daemon instead of swarm")
+    args = parser.parse_args()
+
+    data = load_database()
+    nodes = data.get("nodes", {})
+    containers = []
+    for _, item in data.get("containers", {}).iteritems():
+        item["node_name"] = nodes.get(item.get("node_id"), {}).get("name", "")
+        containers.append(item)
+    containers.sort(key=lambda x: (x["node_name"], x["type"], x["name"]))
+
+    docker_config = "" if args.local else get_swarm_config()
+    report = probe_all(Prober(docker_config, args.timeout), containers,
+                       args.workers, args.budget)
+
+    if args.json:
+        print json.dumps(report, indent=2, sort_keys=True)
+    else:
+        print format_table(report)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        logger.warn("cluster-status aborted by user")
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015 Gluu
+#
+# All rights reserved.
+
+# deploy a basic cluster (discovery+master+worker_1) through gluuengine API
+# and record how long every step takes
+
+import argparse
+import httplib
+import json
+import socket
+import sys
+import time
+import urllib
+import urllib2
+
+ENGINE_URL = 'http://127.0.0.1:8080'
+POLL_DELAY = 1
+POLL_DEADLINE = 1800
+REQUEST_TIMEOUT = 300
+
+CLUSTER = {
+    'name': 'benchmark',
+    'description': 'basic cluster benchmark',
+    'ox_cluster_hostname': 'gluu.weave.local',
+    'org_name': 'Gluu',
+    'org_short_name': 'gluu',
+    'country_code': 'US',
+    'city': 'Austin',
+    'state': 'TX',
+    'admin_email': 'admin@gluu.local',
+    'admin_pw': 'secret',
+}
+
+PROVIDER = {
+    'driver': 'generic',
+    'name': 'benchmark',
+    'generic_ip_address': '127.0.0.1',
+    'generic_ssh_key': '/root/.ssh/id_rsa',
+    'generic_ssh_user': 'root',
+    'generic_ssh_port': '22',
+}
+
+NODES = ['discovery', 'master', 'worker']
+
+# containers deployed on each node, in deployment order
+CONTAINERS = [
+    ('master', 'ldap'),
+    ('master', 'oxauth'),
+    ('master', 'oxtrust'),
+    ('master', 'nginx'),
+    ('worker', 'ldap'),
+    ('worker', 'oxauth'),
+    ('worker', 'nginx'),
+]
+
+
+class ScenarioError(Exception):
+    pass
+
+
+class EngineClient(object):
+    def __init__(self, url, poll_delay=POLL_DELAY):
+        self.url = url.rstrip('/')
+        self.poll_delay = poll_delay
+
+    def request(self, path, data=None, timeout=REQUEST_TIMEOUT):
+        body = urllib.urlencode(data) if data is not None else None
+        method = 'POST' if body else 'GET'
+        try:
+            resp = urllib2.urlopen(self.url + path, body, timeout)
+            item = json.loads(resp.read())
+        except urllib2.HTTPError as exc:
+            raise ScenarioError('{} {} returned {}: {}'.format(
+                method, path, exc.code, exc.read()))
+        except urllib2.URLError as exc:
+            raise ScenarioError('unable to reach {}: {}'.format(self.url, exc.reason))
+        except (socket.error, httplib.HTTPException) as exc:
+            # includes socket.timeout of a hung engine
+            raise ScenarioError('{} {} failed: {!r}'.format(method, path, exc))
+        except ValueError:
+            raise ScenarioError('{} {} returned non-JSON response'.format(method, path))
+        if not isinstance(item, dict):
+            raise ScenarioError('{} {} returned unexpected response'.format(method, path))
+        return item
+
+    def wait_state(self, path, deadline=POLL_DEADLINE):
+        # nodes and containers are provisioned asynchronously
+        expire = time.time() + deadline
+        while time.time() < expire:
+            item = self.request(path, timeout=max(expire - time.time(), 1))
+            if 'state' not in item:
+                # without it, only the POST would be timed
+                raise ScenarioError('{} has no state field'.format(path))
+            if item['state'] == 'SUCCESS':
+                return item
+            if item['state'] == 'FAILED':
+                raise ScenarioError('{} failed'.format(path))
+            time.sleep(self.poll_delay)
+        raise ScenarioError('{} not finished after {}s'.format(path, deadline))
+
+
+def item_id(item, name):
+    try:
+        return item['id']
+    except KeyError:
+        raise ScenarioError('{} response has no id'.format(name))
+
+
+class Scenario(object):
+    def __init__(self, client, cluster=None, provider=None):
+        self.client = client
+        self.cluster = cluster or CLUSTER
+        self.provider = provider or PROVIDER
+        self.steps = []
+
+    def step(self, name, func, *args):
+        started = time.time()
+        status = 'ok'
+        try:
+            return func(*args)
+        except ScenarioError as exc:
+            status = str(exc)
+            raise
+        except Exception as exc:
+            # unexpected engine behaviour still ends up in benchmark result
+            status = 'unexpected error: {!r}'.format(exc)
+            raise ScenarioError(status)
+        finally:
+            self.steps.append({
+                'name': name,
+                'duration': round(time.time() - started, 3),
+                'status': status,
+            })
+            print '{:<30} {:>9.3f}s {}'.format(name, self.steps[-1]['duration'], status)
+
+    def create_cluster(self):
+        return self.client.request('/clusters', self.cluster)
+
+    def create_provider(self):
+        data = dict(self.provider)
+        driver = data.pop('driver')
+        return self.client.request('/providers/{}'.format(driver), data)
+
+    def create_node(self, node_type, provider_id):
+        name = '{}-{}'.format(self.cluster['name'], node_type)
+        self.client.request('/nodes/{}'.format(node_type),
+                            {'name': name, 'provider_id': provider_id})
+        return self.client.wait_state('/nodes/{}'.format(name))
+
+    def create_container(self, container_type, node_id):
+        item = self.client.request('/containers/{}'.format(container_type),
+                                   {'node_id': node_id})
+        return self.client.wait_state('/containers/{}'.format(
+            item_id(item, container_type)))
+
+    def run(self):
+        started = time.time()
+        error = None
+        try:
+            self.step('create cluster', self.create_cluster)
+            provider = self.step('create provider', self.create_provider)
+
+            nodes = {}
+            for node_type in NODES:
+                nodes[node_type] = self.step(
+                    'create {} node'.format(node_type),
+                    self.create_node, node_type,
+                    item_id(provider, 'provider'))
+
+            for node_type, container_type in CONTAINERS:
+                self.step('create {} on {}'.format(container_type, node_type),
+                          self.create_container, container_type,
+                          item_id(nodes[node_type], node_type))
+        except ScenarioError as exc:
+            error = str(exc)
+
+        return {
+            'scenario': 'basic-cluster',
+            'engine_url': self.client.url,
+            'started_at': int(started),
+            'total': round(time.time() - started, 3),
+            'success': error is None,
+            'error': error,
+            'steps': self.steps,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='deploy a basic cluster and record timing of each step')
+    parser.add_argument('--url', default=ENGINE_URL)
+    parser.add_argument('--output', default='benchmark.json',
+                        help='path to JSON result')
+    parser.add_argument('--poll-delay', type=float, default=POLL_DELAY,
+                        help='seconds between node/container state checks')
+    parser.add_argument('--config',
+                        help='JSON file with "cluster" and "provider" overrides')
+    parser.add_argument('--stub', action='store_true',
+                        help='run against local stub of engine API')
+    parser.add_argument('--stub-delay', type=float, default=0.0,
+                        help='seconds the stub keeps nodes/containers in progress')
+    args = parser.parse_args()
+
+    cluster = dict(CLUSTER)
+    provider = dict(PROVIDER)
+    if args.config:
+        with open(args.config) as fp:
+            config = json.load(fp)
+        cluster.update(config.get('cluster', {}))
+        provider.update(config.get('provider', {}))
+
+    url = args.url
+    if args.stub:
+        from stub_engine import StubEngine
+        url = StubEngine(delay=args.stub_delay).start().url
+
+    result = Scenario(EngineClient(url, args.poll_delay), cluster, provider).run()
+    with open(args.output, 'w') as fp:
+        json.dump(result, fp, indent=2, sort_keys=True)
+    print 'total {:.3f}s; result saved to {}'.format(result['total'], args.output)
+    return 0 if result['success'] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
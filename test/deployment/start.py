@@ -4,9 +4,17 @@
 # All rights reserved.
 
 import os
+import socket
+import threading
+import time
 from subprocess import call
 from subprocess import check_output
 
+# readiness polling: first delay, max delay between probes and overall deadline
+READY_DELAY = 0.5
+READY_MAX_DELAY = 5
+READY_DEADLINE = 180
+
 #util
 def run(str_cmd):
     cmd_token = str_cmd.strip().split()
@@ -27,7 +35,7 @@ def pull_image(str_type):
 
 def run_mongo():
     cmd = 'docker run -d --name mongo -v /var/lib/gluuengine/db/mongo:/data/db mongo'
-    run(cmd)
+    return run(cmd)
 
 def run_gluuengine():
     cmd = 'docker run -d -p 127.0.0.1:8080:8080 --name gluuengine \
@@ -36,32 +44,123 @@ def run_gluuengine():
             -v /var/lib/gluuengine/machine:/root/.docker/machine \
             --link mongo:mongo \
             gluuengine'
-    run(cmd)
+    return run(cmd)
 
 def run_gluuwebui():
     cmd = 'docker run -d -p 127.0.0.1:8800:8800 --name gluuwebui \
             --link gluuengine:gluuengine gluuwebui'
-    run(cmd)
+    return run(cmd)
 
 def is_running(str_type):
     cmd = 'docker ps -f name=%s --format {{.Names}}' % str_type
     found = check_output(cmd.strip().split()).strip()
-    return '{} running'.format(str_type) if found == str_type else '{} not running'.format(str_type)
-
-
-# deploy a basic cluster (discovery+master+worker_1)
-# create a cluster
-# create a provider
-# create discovery node
-# create master node
-# create worker node
-# create LDAP on master
-# create oxauth on master
-# create oxtrust on master
-# create nginx on master
-# create ldap on worker
-# create oxauth on worker
-# create nginx on worker
+    return found == str_type
+
+def container_ip(str_type):
+    cmd = 'docker inspect -f {{.NetworkSettings.IPAddress}} %s' % str_type
+    try:
+        return check_output(cmd.strip().split()).strip()
+    except Exception:
+        return ''
+
+def port_open(host, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.settimeout(1)
+    try:
+        sock.connect((host, port))
+        return True
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+
+def wait_ready(str_type, host, port, deadline=READY_DEADLINE):
+    # poll container state and port with exponential backoff until deadline
+    delay = READY_DELAY
+    expire = time.time() + deadline
+    while time.time() < expire:
+        if is_running(str_type):
+            addr = host or container_ip(str_type)
+            if addr and port_open(addr, port):
+                return True
+        time.sleep(min(delay, max(expire - time.time(), 0)))
+        delay = min(delay * 2, READY_MAX_DELAY)
+    return False
+
+# host is None for containers without published port; their IP is used
+COMPONENTS = {
+    'mongo': {'run': run_mongo, 'depends': [], 'host': None, 'port': 27017},
+    'gluuengine': {'run': run_gluuengine, 'depends': ['mongo'],
+                   'host': '127.0.0.1', 'port': 8080},
+    'gluuwebui': {'run': run_gluuwebui, 'depends': ['gluuengine'],
+                  'host': '127.0.0.1', 'port': 8800},
+}
+
+class Component(threading.Thread):
+    # pulls image, waits for dependencies, then starts container and
+    # waits until it is ready; dependents are released via `done` event
+    def __init__(self, name, spec, components, started_at):
+        threading.Thread.__init__(self, name=name)
+        self.daemon = True
+        self.spec = spec
+        self.components = components
+        self.started_at = started_at
+        self.done = threading.Event()
+        self.ready = False
+        self.status = 'pending'
+        self.pull_time = None
+        self.ready_time = None
+
+    def run(self):
+        try:
+            self.ready = self._start()
+        except Exception as exc:
+            self.status = 'error: {}'.format(exc)
+        finally:
+            self.done.set()
+
+    def _start(self):
+        if pull_image(self.name) != 0:
+            self.status = 'pull failed'
+            return False
+        self.pull_time = time.time() - self.started_at
+
+        for dep in self.spec['depends']:
+            self.components[dep].done.wait()
+            if not self.components[dep].ready:
+                self.status = 'dependency {} not ready'.format(dep)
+                return False
+
+        if self.spec['run']() != 0:
+            self.status = 'start failed'
+            return False
+
+        if not wait_ready(self.name, self.spec['host'], self.spec['port']):
+            self.status = 'not ready after {}s'.format(READY_DEADLINE)
+            return False
+
+        self.ready_time = time.time() - self.started_at
+        self.status = 'ready'
+        return True
+
+def start_components(con_list):
+    started_at = time.time()
+    components = {}
+    for name in con_list:
+        components[name] = Component(name, COMPONENTS[name], components, started_at)
+    for component in components.values():
+        component.start()
+    for component in components.values():
+        # join with timeout so KeyboardInterrupt is still delivered
+        while component.is_alive():
+            component.join(1)
+    return [components[name] for name in con_list]
+
+def format_seconds(value):
+    return '-' if value is None else '{:.2f}s'.format(value)
+
+
+# deploy a basic cluster (discovery+master+worker_1): see scenario.py
 
 # test besic oxtrust login
 
@@ -69,13 +168,11 @@ def main():
     if not docker():
         return
     con_list = ['mongo', 'gluuengine', 'gluuwebui']
-    map(pull_image, con_list)
-    run_mongo()
-    run_gluuengine()
-    run_gluuwebui()
-    run_status_list = map(is_running, con_list)
-    for status in run_status_list:
-        print status
+    for component in start_components(con_list):
+        print '{} {} (pulled {}, ready {})'.format(
+            component.name, component.status,
+            format_seconds(component.pull_time),
+            format_seconds(component.ready_time))
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015 Gluu
+#
+# All rights reserved.
+
+# minimal in-memory stand-in for gluuengine REST API; nodes and containers
+# stay IN_PROGRESS for `delay` seconds before switching to SUCCESS
+
+import json
+import threading
+import time
+import uuid
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler
+from BaseHTTPServer import HTTPServer
+from SocketServer import ThreadingMixIn
+
+NODE_TYPES = ('discovery', 'master', 'worker')
+CONTAINER_TYPES = ('ldap', 'oxauth', 'oxtrust', 'oxidp', 'nginx')
+
+
+class StubState(object):
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.clusters = {}
+        self.providers = {}
+        self.nodes = {}
+        self.containers = {}
+
+    def _new(self, store, item):
+        item['id'] = str(uuid.uuid4())
+        item['_created_at'] = time.time()
+        with self.lock:
+            store[item['id']] = item
+        return item
+
+    def _view(self, item):
+        item = dict(item)
+        created_at = item.pop('_created_at', 0)
+        if 'state' in item and time.time() - created_at >= self.delay:
+            item['state'] = 'SUCCESS'
+        return item
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, fmt, *args):
+        pass
+
+    def _reply(self, code, data):
+        body = json.dumps(data)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _form(self):
+        length = int(self.headers.getheader('content-length') or 0)
+        data = urlparse.parse_qs(self.rfile.read(length))
+        return dict((key, value[0]) for key, value in data.iteritems())
+
+    def do_GET(self):
+        state = self.server.state
+        parts = self.path.strip('/').split('/')
+        stores = {
+            'clusters': state.clusters,
+            'providers': state.providers,
+            'nodes': state.nodes,
+            'containers': state.containers,
+        }
+        store = stores.get(parts[0])
+        if store is None:
+            return self._reply(404, {'message': 'not found'})
+
+        if len(parts) == 1:
+            return self._reply(200, [state._view(item) for item in store.values()])
+
+        # nodes are looked up by name, everything else by ID
+        for item in store.values():
+            if parts[1] in (item['id'], item.get('name')):
+                return self._reply(200, state._view(item))
+        return self._reply(404, {'message': 'not found'})
+
+    def do_POST(self):
+        state = self.server.state
+        parts = self.path.strip('/').split('/')
+        form = self._form()
+
+        if parts == ['clusters']:
+            item = state._new(state.clusters, form)
+        elif parts[0] == 'providers' and len(parts) == 2:
+            form['driver'] = parts[1]
+            item = state._new(state.providers, form)
+        elif parts[0] == 'nodes' and len(parts) == 2 and parts[1] in NODE_TYPES:
+            if form.get('provider_id') not in state.providers:
+                return self._reply(400, {'message': 'invalid provider_id'})
+            form.update(type=parts[1], state='IN_PROGRESS')
+            item = state._new(state.nodes, form)
+        elif parts[0] == 'containers' and len(parts) == 2 and parts[1] in CONTAINER_TYPES:
+            if form.get('node_id') not in state.nodes:
+                return self._reply(400, {'message': 'invalid node_id'})
+            form.update(type=parts[1], state='IN_PROGRESS')
+            item = state._new(state.containers, form)
+        else:
+            return self._reply(404, {'message': 'not found'})
+        return self._reply(201, state._view(item))
+
+
+class StubEngine(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=('127.0.0.1', 0), delay=0.0):
+        HTTPServer.__init__(self, address, StubHandler)
+        self.state = StubState(delay)
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(*self.server_address)
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
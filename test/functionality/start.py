@@ -3,8 +3,293 @@
 #
 # All rights reserved.
 
+# login load test through nginx front end; each worker repeatedly runs
+# oxauth token + userinfo flow and oxtrust login (OpenID Connect redirect to
+# oxauth login form and back), and latency of every request is recorded
+# per endpoint
+
+import argparse
+import base64
+import cookielib
+import json
+import math
+import ssl
+import sys
+import threading
+import time
+import urllib
+import urllib2
+import urlparse
+from HTMLParser import HTMLParser
+
+BASE_URL = 'https://127.0.0.1'
+TOKEN_PATH = '/oxauth/seam/resource/restv1/oxauth/token'
+USERINFO_PATH = '/oxauth/seam/resource/restv1/oxauth/userinfo'
+OXTRUST_PATH = '/identity'
+PERCENTILES = (50, 95, 99)
+
+
+class Stats(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, endpoint, latency, ok):
+        with self.lock:
+            if ok:
+                self.latencies.setdefault(endpoint, []).append(
+                    (time.time(), latency))
+            else:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def report(self, elapsed, steady_from, steady_elapsed):
+        # rps is measured after ramp-up; rps_overall includes ramp-up
+        endpoints = sorted(set(self.latencies) | set(self.errors))
+        result = {}
+        for endpoint in endpoints:
+            samples = self.latencies.get(endpoint, [])
+            latencies = sorted(latency for _, latency in samples)
+            steady = len([1 for at, _ in samples if at >= steady_from])
+            item = {
+                'requests': len(latencies),
+                'errors': self.errors.get(endpoint, 0),
+                'rps': round(steady / steady_elapsed, 2) if steady_elapsed > 0 else 0,
+                'rps_overall': round(len(latencies) / elapsed, 2) if elapsed else 0,
+            }
+            for pct in PERCENTILES:
+                item['p{}'.format(pct)] = round(percentile(latencies, pct) * 1000, 2)
+            result[endpoint] = item
+        return result
+
+
+def percentile(values, pct):
+    # nearest-rank percentile of sorted values
+    if not values:
+        return 0.0
+    rank = int(math.ceil(pct / 100.0 * len(values))) - 1
+    return values[min(max(rank, 0), len(values) - 1)]
+
+
+def parse_token(body, url):
+    token = json.loads(body).get('access_token')
+    if not token:
+        raise ValueError('no access_token in response')
+    return token
+
+
+class LoginFormParser(HTMLParser):
+    # collects action and inputs of the first form in oxauth login page
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.action = None
+        self.inputs = []
+        self.in_form = False
+        self.done = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'form' and not self.done:
+            self.in_form = True
+            self.action = attrs.get('action', '')
+        elif tag == 'input' and self.in_form and attrs.get('name'):
+            self.inputs.append(attrs)
+
+    def handle_endtag(self, tag):
+        if tag == 'form' and self.in_form:
+            self.in_form = False
+            self.done = True
+
+
+def parse_login_form(body, url):
+    parser = LoginFormParser()
+    parser.feed(body.decode('utf-8', 'replace'))
+    types = [item.get('type', 'text') for item in parser.inputs]
+    if parser.action is None or 'password' not in types:
+        raise ValueError('no login form in {}'.format(url))
+    return urlparse.urljoin(url, parser.action), parser.inputs
+
+
+def check_oxtrust_session(body, url):
+    # oxtrust redirects back to login form if credentials are rejected
+    path = urlparse.urlparse(url).path
+    if not path.startswith(OXTRUST_PATH):
+        raise ValueError('login ended at {}'.format(url))
+    return url
+
+
+class LoginFlow(object):
+    def __init__(self, base_url, username, password, client_id,
+                 client_secret, timeout, insecure):
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.client_auth = 'Basic ' + base64.b64encode(
+            '{}:{}'.format(client_id, client_secret))
+        self.timeout = timeout
+
+        self.handlers = []
+        if insecure and hasattr(ssl, '_create_unverified_context'):
+            # nginx usually serves self-signed certificate
+            self.handlers.append(urllib2.HTTPSHandler(
+                context=ssl._create_unverified_context()))
+        self.opener = urllib2.build_opener(*self.handlers)
+
+    def _call(self, stats, endpoint, url, data=None, headers=None,
+              parse=None, opener=None):
+        # parse: optional callable validating response body and final URL;
+        # a ValueError from it (e.g. HTML error page instead of JSON) counts
+        # as error
+        if url.startswith('/'):
+            url = self.base_url + url
+        req = urllib2.Request(url, data, headers or {})
+        started = time.time()
+        result = None
+        try:
+            resp = (opener or self.opener).open(req, timeout=self.timeout)
+            result = resp.read()
+            if parse:
+                result = parse(result, resp.geturl())
+            ok = True
+        except Exception:
+            result = None
+            ok = False
+        stats.record(endpoint, time.time() - started, ok)
+        return result
+
+    def run(self, stats):
+        token = self._call(stats, 'token', TOKEN_PATH, urllib.urlencode({
+            'grant_type': 'password',
+            'username': self.username,
+            'password': self.password,
+            'scope': 'openid',
+        }), {'Authorization': self.client_auth}, parse=parse_token)
+
+        if token is not None:
+            self._call(stats, 'userinfo', USERINFO_PATH,
+                       headers={'Authorization': 'Bearer {}'.format(token)})
+
+        self.oxtrust_login(stats)
+
+    def oxtrust_login(self, stats):
+        # every login starts without cookies, like a new browser session;
+        # redirects (oxtrust -> oxauth authorize -> login form and back with
+        # authorization code) are followed and timed within each step
+        opener = urllib2.build_opener(
+            urllib2.HTTPCookieProcessor(cookielib.CookieJar()),
+            *self.handlers)
+
+        form = self._call(stats, 'login_form', OXTRUST_PATH,
+                          parse=parse_login_form, opener=opener)
+        if form is None:
+            return
+        action, inputs = form
+
+        data = []
+        for item in inputs:
+            kind = item.get('type', 'text')
+            if kind == 'password':
+                value = self.password
+            elif kind in ('text', 'email'):
+                value = self.username
+            elif kind in ('hidden', 'submit'):
+                # hidden fields carry JSF view state
+                value = item.get('value', '')
+            else:
+                continue
+            data.append((item['name'], value.encode('utf-8')))
+
+        self._call(stats, 'login', action, urllib.urlencode(data),
+                   parse=check_oxtrust_session, opener=opener)
+
+
+def worker(flow, stats, start_at, stop_at, iterations):
+    # ramp-up: each worker waits for its own start time
+    time.sleep(max(start_at - time.time(), 0))
+    count = 0
+    while time.time() < stop_at and (not iterations or count < iterations):
+        try:
+            flow.run(stats)
+        except Exception:
+            # keep the worker alive so concurrency stays as configured
+            stats.record('flow', 0, False)
+        count += 1
+
+
+def run_load(flow, concurrency, duration, rampup, iterations=0):
+    stats = Stats()
+    started = time.time()
+    stop_at = started + rampup + duration
+    threads = []
+    for idx in range(concurrency):
+        start_at = started + rampup * idx / float(concurrency)
+        thread = threading.Thread(target=worker, args=(
+            flow, stats, start_at, stop_at, iterations))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(1)
+    finished = time.time()
+    elapsed = finished - started
+    steady_from = started + rampup
+    return {
+        'concurrency': concurrency,
+        'rampup': rampup,
+        'elapsed': round(elapsed, 3),
+        'endpoints': stats.report(elapsed, steady_from, finished - steady_from),
+    }
+
+
 def main():
-    pass
+    parser = argparse.ArgumentParser(
+        description='login load test for oxauth and oxtrust')
+    parser.add_argument('--url', default=BASE_URL, help='nginx front end URL')
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=30,
+                        help='seconds to run after ramp-up')
+    parser.add_argument('--rampup', type=float, default=5,
+                        help='seconds until all workers are started')
+    parser.add_argument('--iterations', type=int, default=0,
+                        help='max flows per worker; 0 means unlimited')
+    parser.add_argument('--timeout', type=float, default=10)
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='secret')
+    parser.add_argument('--client-id', default='')
+    parser.add_argument('--client-secret', default='')
+    parser.add_argument('--insecure', action='store_true',
+                        help='skip TLS certificate verification')
+    parser.add_argument('--output', help='path to JSON result')
+    parser.add_argument('--stub', action='store_true',
+                        help='run against local stub IdP')
+    parser.add_argument('--stub-latency', type=float, default=0.0)
+    args = parser.parse_args()
+
+    url = args.url
+    if args.stub:
+        from stub_idp import StubIdp
+        url = StubIdp(latency=args.stub_latency, username=args.username,
+                      password=args.password).start().url
+
+    flow = LoginFlow(url, args.username, args.password, args.client_id,
+                     args.client_secret, args.timeout, args.insecure)
+    result = run_load(flow, args.concurrency, args.duration, args.rampup,
+                      args.iterations)
+    result['url'] = url
+
+    print '{:<10} {:>8} {:>6} {:>9} {:>11} {:>9} {:>9} {:>9}'.format(
+        'endpoint', 'requests', 'errors', 'req/s', 'req/s (all)',
+        'p50 ms', 'p95 ms', 'p99 ms')
+    for endpoint, item in sorted(result['endpoints'].iteritems()):
+        print '{:<10} {:>8} {:>6} {:>9} {:>11} {:>9} {:>9} {:>9}'.format(
+            endpoint, item['requests'], item['errors'], item['rps'],
+            item['rps_overall'], item['p50'], item['p95'], item['p99'])
+
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(result, fp, indent=2, sort_keys=True)
+    return 0
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    sys.exit(main())
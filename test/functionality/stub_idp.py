@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2015 Gluu
+#
+# All rights reserved.
+
+# minimal stand-in for oxAuth/oxTrust behind nginx; serves the endpoints
+# exercised by start.py with optional artificial latency
+
+import base64
+import json
+import threading
+import time
+import urllib
+import urlparse
+import uuid
+from BaseHTTPServer import BaseHTTPRequestHandler
+from BaseHTTPServer import HTTPServer
+from Cookie import SimpleCookie
+from SocketServer import ThreadingMixIn
+
+from start import OXTRUST_PATH
+from start import TOKEN_PATH
+from start import USERINFO_PATH
+
+AUTHORIZE_PATH = '/oxauth/authorize'
+LOGIN_PATH = '/oxauth/login.htm'
+OXTRUST_AUTHCODE_PATH = '/identity/authentication/authcode'
+OXTRUST_HOME_PATH = '/identity/home.htm'
+
+LOGIN_PAGE = """<html><body>
+<form id="loginForm" name="loginForm" method="post" action="{action}">
+<input type="hidden" name="loginForm" value="loginForm"/>
+<input type="text" name="loginForm:username"/>
+<input type="password" name="loginForm:password"/>
+<input type="submit" name="loginForm:loginButton" value="Login"/>
+<input type="hidden" name="javax.faces.ViewState" value="{view_state}"/>
+</form>
+</body></html>
+"""
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _reply(self, code, data=None, headers=None):
+        body = json.dumps(data) if data is not None else ''
+        self._send(code, body, 'application/json', headers)
+
+    def _send(self, code, body, content_type, headers=None):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).iteritems():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _redirect(self, location, cookie=None):
+        headers = {'Location': location}
+        if cookie:
+            headers['Set-Cookie'] = '{}={}; Path=/'.format(*cookie)
+        return self._reply(302, headers=headers)
+
+    def _cookie(self, name):
+        cookie = SimpleCookie(self.headers.getheader('cookie') or '')
+        return cookie[name].value if name in cookie else None
+
+    def _delay(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+    def do_GET(self):
+        self._delay()
+        parsed = urlparse.urlparse(self.path)
+        path = parsed.path
+        query = dict((key, value[0]) for key, value in
+                     urlparse.parse_qs(parsed.query).iteritems())
+        sessions = self.server.sessions
+
+        if path == USERINFO_PATH:
+            auth = self.headers.getheader('authorization') or ''
+            token = auth[len('Bearer '):]
+            if not auth.startswith('Bearer ') or token not in self.server.tokens:
+                return self._reply(401, {'error': 'invalid_token'})
+            return self._reply(200, {'sub': self.server.tokens[token]})
+
+        # oxtrust: unauthenticated requests start OpenID Connect code flow
+        if path.rstrip('/') == OXTRUST_PATH or path == OXTRUST_HOME_PATH:
+            if sessions.get(self._cookie('JSESSIONID')) == 'oxtrust':
+                if path == OXTRUST_HOME_PATH:
+                    return self._send(200, '<html>home</html>', 'text/html')
+                return self._redirect(OXTRUST_HOME_PATH)
+            return self._redirect('{}?{}'.format(AUTHORIZE_PATH, urllib.urlencode({
+                'response_type': 'code',
+                'client_id': 'oxtrust',
+                'scope': 'openid',
+                'redirect_uri': OXTRUST_AUTHCODE_PATH,
+            })))
+        if path == OXTRUST_AUTHCODE_PATH:
+            if sessions.pop(query.get('code'), None) != 'code':
+                return self._reply(401, {'error': 'invalid_code'})
+            session_id = str(uuid.uuid4())
+            sessions[session_id] = 'oxtrust'
+            return self._redirect(OXTRUST_HOME_PATH,
+                                  ('JSESSIONID', session_id))
+
+        # oxauth: authorize issues code once session is authenticated
+        if path == AUTHORIZE_PATH:
+            session_id = self._cookie('session_id')
+            if sessions.get(session_id) == 'authenticated':
+                code = str(uuid.uuid4())
+                sessions[code] = 'code'
+                return self._redirect('{}?code={}'.format(
+                    query.get('redirect_uri', '/'), code))
+            session_id = str(uuid.uuid4())
+            sessions[session_id] = self.path
+            return self._redirect(LOGIN_PATH, ('session_id', session_id))
+        if path == LOGIN_PATH:
+            view_state = str(uuid.uuid4())
+            sessions[view_state] = 'view'
+            return self._send(200, LOGIN_PAGE.format(
+                action=LOGIN_PATH, view_state=view_state), 'text/html')
+        return self._reply(404, {'error': 'not_found'})
+
+    def do_POST(self):
+        length = int(self.headers.getheader('content-length') or 0)
+        form = dict((key, value[0]) for key, value in
+                    urlparse.parse_qs(self.rfile.read(length)).iteritems())
+        self._delay()
+
+        if self.path == LOGIN_PATH:
+            return self._login(form)
+        if self.path != TOKEN_PATH:
+            return self._reply(404, {'error': 'not_found'})
+
+        auth = self.headers.getheader('authorization') or ''
+        if not auth.startswith('Basic ') or ':' not in base64.b64decode(auth[6:]):
+            return self._reply(401, {'error': 'invalid_client'})
+        if form.get('grant_type') != 'password' or not form.get('username'):
+            return self._reply(400, {'error': 'invalid_grant'})
+
+        token = str(uuid.uuid4())
+        self.server.tokens[token] = form['username']
+        return self._reply(200, {
+            'access_token': token,
+            'token_type': 'bearer',
+            'expires_in': 299,
+        })
+
+    def _login(self, form):
+        sessions = self.server.sessions
+        session_id = self._cookie('session_id')
+        authorize = sessions.get(session_id)
+        if (sessions.pop(form.get('javax.faces.ViewState'), None) != 'view' or
+                not authorize or not authorize.startswith(AUTHORIZE_PATH)):
+            return self._reply(400, {'error': 'invalid_session'})
+        if (form.get('loginForm:username') != self.server.username or
+                form.get('loginForm:password') != self.server.password):
+            # rejected credentials render login form again
+            return self._redirect(LOGIN_PATH)
+        sessions[session_id] = 'authenticated'
+        return self._redirect(authorize)
+
+
+class StubIdp(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.0,
+                 username='admin', password='secret'):
+        HTTPServer.__init__(self, address, StubHandler)
+        self.latency = latency
+        self.username = username
+        self.password = password
+        self.tokens = {}
+        self.sessions = {}
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(*self.server_address)
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self